@@ -16,9 +16,11 @@ The database supports the following commands:
 
 """
 
-from collections import defaultdict
+import sys
 from typing import Optional
 
+_MISSING = object()
+
 
 class DBClient:
     def get(self, key: str) -> Optional[int]:
@@ -37,103 +39,155 @@ class DBClient:
 class InMemoryDBClient(DBClient):
     def __init__(self) -> None:
         self.data = {}
-        self.counts = defaultdict(int)
+        # only values currently held by at least one key are present
+        self.counts: dict[int, int] = {}
 
     def get(self, key: str) -> Optional[int]:
-        if key in self.data:
-            return self.data[key]
-
-        return None
+        return self.data.get(key)
 
     def set(self, key: str, value: int) -> None:
-        if key in self.data:
-            self.counts[self.data[key]] -= 1
+        current = self.data.get(key)
+        if current == value:
+            return
+
+        if current is not None:
+            self.__decrement_count(current)
 
         self.data[key] = value
-        self.counts[value] += 1
+        self.counts[value] = self.counts.get(value, 0) + 1
 
     def delete(self, key: str) -> None:
-        if key not in self.data:
+        value = self.data.pop(key, _MISSING)
+        if value is _MISSING:
             raise Exception(f"Key {key} not found")
 
-        self.counts[self.data[key]] -= 1
-        del self.data[key]
+        self.__decrement_count(value)
 
     def count(self, value: int) -> int:
-        return self.counts[value]
+        return self.counts.get(value, 0)
 
+    def __decrement_count(self, value: int) -> None:
+        remaining = self.counts[value] - 1
+        if remaining == 0:
+            del self.counts[value]
+        else:
+            self.counts[value] = remaining
 
-class TransactionLogEntry:
-    def __init__(self, key: str, old_value: Optional[int], new_value: Optional[int]) -> None:
-        self.key = key
-        self.old_value = old_value
-        self.new_value = new_value
 
-    def is_create_operation(self) -> bool:
-        return self.old_value is None and self.new_value is not None
+# (write-set, count deltas) for one open transaction; None in the write-set marks a deleted key
+TransactionLevel = tuple[dict[str, Optional[int]], dict[int, int]]
 
 
 class TransactionsHandler:
 
     def __init__(self, client: DBClient) -> None:
         self.client = client
-        self.transaction_log = []
-        self.transaction_marker = "BEGIN"
+        # one level per open transaction, innermost last
+        self.tx_stack: list[TransactionLevel] = []
+        # number of open transactions, kept alongside tx_stack for the write fast path
+        self._depth = 0
 
     def begin(self) -> None:
-        self.transaction_log.append(self.transaction_marker)
+        self.tx_stack.append(({}, {}))
+        self._depth += 1
 
     def commit(self) -> None:
-        if not self.transaction_active():
+        if self._depth == 0:
             raise Exception("No transaction to commit")
 
-        self.transaction_log = []
+        merged = {}
+        for writes, _ in self.tx_stack:
+            merged.update(writes)
+
+        client_get = self.client.get
+        client_set = self.client.set
+        client_delete = self.client.delete
+        for key, value in merged.items():
+            if value is not None:
+                client_set(key, value)
+            elif client_get(key) is not None:
+                client_delete(key)
+
+        self.tx_stack.clear()
+        self._depth = 0
 
     def rollback(self) -> None:
-        if not self.transaction_active():
+        if self._depth == 0:
             raise Exception("No transaction to rollback")
 
-        self.__apply_rollback__()
-        self.transaction_log.pop()  # removes the transaction marker
-
-    def begin(self) -> None:
-        self.transaction_log.append(self.transaction_marker)
+        # nothing reached the client yet, dropping the level is enough
+        self.tx_stack.pop()
+        self._depth -= 1
 
     def get(self, key: str) -> Optional[int]:
-        return self.client.get(key)
+        if self._depth == 0:
+            return self.client.get(key)
+
+        return self.__visible_value(key)
 
     def set(self, key: str, value: int) -> None:
-        if not self.transaction_active():
+        # stored keys are interned so probes with literal keys match by identity;
+        # sys.intern rejects str subclasses, which are used as given
+        if type(key) is str:
+            key = sys.intern(key)
+
+        if self._depth == 0:
             self.client.set(key, value)
             return
 
-        old_value = None if key not in self.client.data else self.client.data[key]
-        self.transaction_log.append(TransactionLogEntry(key, old_value, value))
-        self.client.set(key, value)
+        old_value = self.__visible_value(key)
+        if old_value == value:
+            return
 
-    def delete(self, key: str) -> None:
-        if key not in self.client.data:
-            raise Exception(f"Key {key} not found")
+        writes, deltas = self.tx_stack[-1]
+        writes[key] = value
+        self.__record_change(deltas, old_value, value)
 
-        if not self.transaction_active():
+    def delete(self, key: str) -> None:
+        if self._depth == 0:
             self.client.delete(key)
             return
 
-        old_value = self.client.data[key]
-        self.transaction_log.append(TransactionLogEntry(key, old_value, None))
-        self.client.delete(key)
+        old_value = self.__visible_value(key)
+        if old_value is None:
+            raise Exception(f"Key {key} not found")
+
+        writes, deltas = self.tx_stack[-1]
+        writes[key] = None
+        self.__record_change(deltas, old_value, None)
 
     def count(self, value: int) -> int:
-        return self.client.count(value)
+        if self._depth == 0:
+            return self.client.count(value)
+
+        total = self.client.count(value)
+        for _, deltas in self.tx_stack:
+            total += deltas.get(value, 0)
+
+        return total
 
     def transaction_active(self) -> bool:
-        # truthy when transaction_log is not empty
-        return self.transaction_log
-
-    def __apply_rollback__(self) -> None:
-        while self.transaction_log[-1] != self.transaction_marker:
-            entry = self.transaction_log.pop()
-            if entry.is_create_operation():
-                self.client.delete(entry.key)
-            else:
-                self.client.set(entry.key, entry.old_value)
+        return self._depth > 0
+
+    def __visible_value(self, key: str) -> Optional[int]:
+        for writes, _ in reversed(self.tx_stack):
+            value = writes.get(key, _MISSING)
+            if value is not _MISSING:
+                return value
+
+        return self.client.get(key)
+
+    def __record_change(
+        self, deltas: dict[int, int], old_value: Optional[int], new_value: Optional[int]
+    ) -> None:
+        if old_value is not None:
+            self.__shift_count(deltas, old_value, -1)
+        if new_value is not None:
+            self.__shift_count(deltas, new_value, 1)
+
+    def __shift_count(self, deltas: dict[int, int], value: int, change: int) -> None:
+        shifted = deltas.get(value, 0) + change
+        if shifted == 0:
+            del deltas[value]
+        else:
+            deltas[value] = shifted
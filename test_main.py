@@ -67,7 +67,8 @@ def test_with_nested_transactions():
     handler.begin()
     handler.set("c", 6)
     handler.rollback()
-    assert client.data == {"a": 1, "b": 4, "c": 5}
+    assert client.data == {"a": 1, "b": 2, "c": 3}
+    assert [handler.get(key) for key in "abc"] == [1, 4, 5]
     assert handler.count(4) == 1
     assert handler.count(5) == 1
     assert handler.count(6) == 0
@@ -120,6 +121,128 @@ def test_rollback_with_multiple_transactions():
     handler.set("b", 4)
     handler.set("c", 5)
     handler.rollback()
-    assert client.data == {"a": 1, "b": 2, "c": 3}
+    assert client.data == {}
+    assert [handler.get(key) for key in "abc"] == [1, 2, 3]
+    handler.rollback()
+    assert client.data == {}
+    assert [handler.get(key) for key in "abc"] == [None, None, None]
+
+def test_rollback_restores_deleted_keys_across_nested_transactions():
+    client = InMemoryDBClient()
+    handler = TransactionsHandler(client)
+    handler.set("a", 1)
+    handler.begin()
+    handler.delete("a")
+    handler.begin()
+    handler.set("a", 2)
+    handler.rollback()
+    assert handler.get("a") is None
+    assert handler.count(1) == 0
+    handler.rollback()
+    assert client.data == {"a": 1}
+    assert handler.count(1) == 1
+
+def test_set_same_value_is_not_logged():
+    client = InMemoryDBClient()
+    handler = TransactionsHandler(client)
+    handler.set("a", 1)
+    handler.begin()
+    handler.set("a", 1)
+    assert handler.tx_stack == [({}, {})]
+    assert handler.count(1) == 1
+    handler.rollback()
+    assert client.data == {"a": 1}
+    assert handler.count(1) == 1
+
+def test_counts_only_track_live_values():
+    client = InMemoryDBClient()
+    handler = TransactionsHandler(client)
+    handler.set("a", 1)
+    handler.set("b", 1)
+    handler.set("a", 2)
+    assert client.counts == {1: 1, 2: 1}
+    handler.delete("b")
+    assert client.counts == {2: 1}
+    assert handler.count(1) == 0
+    assert client.counts == {2: 1}
+
+def test_rollback_restores_key_written_many_times():
+    client = InMemoryDBClient()
+    handler = TransactionsHandler(client)
+    handler.set("a", 1)
+    handler.begin()
+    handler.set("a", 2)
+    handler.set("a", 3)
+    handler.delete("a")
+    handler.set("b", 3)
+    handler.set("a", 4)
     handler.rollback()
+    assert client.data == {"a": 1}
+    assert client.counts == {1: 1}
+
+def test_transaction_writes_reach_client_on_commit():
+    client = InMemoryDBClient()
+    handler = TransactionsHandler(client)
+    handler.set("a", 1)
+    handler.begin()
+    handler.set("b", 2)
+    handler.delete("a")
+    handler.begin()
+    handler.set("c", 2)
+    handler.delete("c")
+    assert client.data == {"a": 1}
+    assert handler.get("a") is None
+    assert handler.count(1) == 0
+    assert handler.count(2) == 1
+    handler.commit()
+    assert client.data == {"b": 2}
+    assert client.counts == {2: 1}
+
+def test_transaction_keeps_one_write_per_key():
+    client = InMemoryDBClient()
+    handler = TransactionsHandler(client)
+    handler.begin()
+    handler.set("a", 1)
+    handler.set("a", 2)
+    handler.set("a", 3)
+    handler.delete("a")
+    handler.set("b", 1)
+    assert handler.tx_stack == [({"a": None, "b": 1}, {1: 1})]
+    assert handler.count(1) == 1
+    assert handler.count(3) == 0
+
+def test_rollback_of_key_created_and_deleted_in_transaction():
+    client = InMemoryDBClient()
+    handler = TransactionsHandler(client)
+    handler.begin()
+    handler.set("x", 1)
+    handler.delete("x")
+    handler.rollback()
+    assert client.data == {}
+    assert handler.get("x") is None
+    assert handler.count(1) == 0
+    assert not handler.transaction_active()
+
+def test_count_deltas_only_track_net_changes():
+    client = InMemoryDBClient()
+    handler = TransactionsHandler(client)
+    handler.set("a", 1)
+    handler.begin()
+    handler.set("a", 2)
+    handler.set("a", 1)
+    assert handler.tx_stack == [({"a": 1}, {})]
+    assert handler.count(1) == 1
+    assert handler.count(2) == 0
+
+def test_str_subclass_keys_are_accepted():
+    class Key(str):
+        pass
+
+    client = InMemoryDBClient()
+    handler = TransactionsHandler(client)
+    handler.set(Key("a"), 1)
+    assert handler.get(Key("a")) == 1
+    handler.begin()
+    handler.delete(Key("a"))
+    handler.commit()
     assert client.data == {}